@@ -9,9 +9,10 @@ Edit two files side by side, showing differences.
 
 import asyncio
 import atexit
-import contextlib
+import bisect
 import difflib
 import functools
+import itertools
 import os
 import shutil
 import subprocess
@@ -54,38 +55,147 @@ Keys:
 _LINE_MAP = {"━": 0b0101, "┃": 0b1010, "┏": 0b0110, "┗": 0b1100, "┛": 0b1001, "┓": 0b0011,
              "╋": 0b1111, "┣": 0b1110, "┳": 0b0111, "┫": 0b1011, "┻": 0b1101, " ": 0b0000}
 _LINE_MAP_INVERTED = {v: k for k, v in _LINE_MAP.items()}
+_VERTICAL_MASK = _LINE_MAP["┃"]
 
 
-@functools.cache
-def union_box_line(a_line, b_line):
-    return _LINE_MAP_INVERTED[_LINE_MAP[a_line] | _LINE_MAP[b_line]]
+@functools.lru_cache(maxsize=4096)
+def blend_style(style, bg_color, transparency):
+    return termstr.CharStyle(
+        termstr.blend_color(style.fg_rgb_color, bg_color, transparency),
+        termstr.blend_color(style.bg_rgb_color, bg_color, transparency),
+        is_bold=style.is_bold, is_italic=style.is_italic, is_underlined=style.is_underlined)
 
 
-@functools.lru_cache(maxsize=500)
+@functools.lru_cache(maxsize=4096)
 def highlight_str(line, bg_color, transparency):
-    def blend_style(style):
-        return termstr.CharStyle(
-            termstr.blend_color(style.fg_rgb_color, bg_color, transparency),
-            termstr.blend_color(style.bg_rgb_color, bg_color, transparency),
-            is_bold=style.is_bold, is_italic=style.is_italic, is_underlined=style.is_underlined)
-    return termstr.TermStr(line).transform_style(blend_style)
+    return termstr.TermStr(line).transform_style(
+        lambda style: blend_style(style, bg_color, transparency))
 
 
-@functools.lru_cache(maxsize=500)
-def line_diff(a_text, b_text):
-    return difflib.SequenceMatcher(a=a_text, b=b_text).get_opcodes()
+MAX_LINE_DIFF_LENGTH = 10000
 
 
-def get_lines(text_editor, start, end):
+@functools.lru_cache(maxsize=4096)
+def line_diff(a_text, b_text):
+    if len(a_text) + len(b_text) > MAX_LINE_DIFF_LENGTH:
+        return [("replace", 0, len(a_text), 0, len(b_text))]
+    return myers_diff(a_text, b_text)
+
+
+MAX_EDIT_DISTANCE = 500
+
+
+def _myers_moves(a, b):
+    a_len, b_len = len(a), len(b)
+    frontier = {1: 0}
+    trace = []
+    for d in range(min(a_len + b_len, MAX_EDIT_DISTANCE) + 1):
+        trace.append(frontier.copy())
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and frontier[k-1] < frontier[k+1]):
+                x = frontier[k+1]
+            else:
+                x = frontier[k-1] + 1
+            y = x - k
+            while x < a_len and y < b_len and a[x] == b[y]:
+                x, y = x + 1, y + 1
+            frontier[k] = x
+            if x >= a_len and y >= b_len:
+                return _backtrack_moves(trace, a_len, b_len)
+
+
+def _backtrack_moves(trace, x, y):
+    moves = []
+    for d in range(len(trace) - 1, 0, -1):
+        frontier = trace[d]
+        k = x - y
+        if k == -d or (k != d and frontier[k-1] < frontier[k+1]):
+            previous_k = k + 1
+        else:
+            previous_k = k - 1
+        previous_x = frontier[previous_k]
+        previous_y = previous_x - previous_k
+        while x > previous_x and y > previous_y:
+            moves.append(("equal", x - 1, y - 1))
+            x, y = x - 1, y - 1
+        moves.append(("insert", x, y - 1) if x == previous_x else ("delete", x - 1, y))
+        x, y = previous_x, previous_y
+    while x > 0 and y > 0:
+        moves.append(("equal", x - 1, y - 1))
+        x, y = x - 1, y - 1
+    moves.reverse()
+    return moves
+
+
+def _moves_to_opcodes(moves):
+    opcodes = []
+    for move, a_index, b_index in moves:
+        last = opcodes[-1] if opcodes else None
+        if move == "equal":
+            if last is not None and last[0] == "equal" and last[2] == a_index:
+                opcodes[-1] = ("equal", last[1], a_index + 1, last[3], b_index + 1)
+            else:
+                opcodes.append(("equal", a_index, a_index + 1, b_index, b_index + 1))
+        elif move == "delete":
+            if last is not None and last[0] != "equal" and last[2] == a_index:
+                opcode = "replace" if last[0] in ["insert", "replace"] else "delete"
+                opcodes[-1] = (opcode, last[1], a_index + 1, last[3], last[4])
+            else:
+                opcodes.append(("delete", a_index, a_index + 1, b_index, b_index))
+        else:  # move == "insert"
+            if last is not None and last[0] != "equal" and last[4] == b_index:
+                opcode = "replace" if last[0] in ["delete", "replace"] else "insert"
+                opcodes[-1] = (opcode, last[1], last[2], last[3], b_index + 1)
+            else:
+                opcodes.append(("insert", a_index, a_index, b_index, b_index + 1))
+    return opcodes
+
+
+def _common_affix_lengths(a, b):
+    prefix_length = 0
+    max_prefix_length = min(len(a), len(b))
+    while prefix_length < max_prefix_length and a[prefix_length] == b[prefix_length]:
+        prefix_length += 1
+    suffix_length = 0
+    max_suffix_length = max_prefix_length - prefix_length
+    while suffix_length < max_suffix_length and \
+            a[len(a)-1-suffix_length] == b[len(b)-1-suffix_length]:
+        suffix_length += 1
+    return prefix_length, suffix_length
+
+
+def myers_diff(a, b):
+    prefix_length, suffix_length = _common_affix_lengths(a, b)
+    a_middle = a[prefix_length:len(a)-suffix_length]
+    b_middle = b[prefix_length:len(b)-suffix_length]
+    moves = _myers_moves(a_middle, b_middle)
+    if moves is None:  # Too dissimilar for an optimal diff in reasonable time and space.
+        matcher = difflib.SequenceMatcher(a=a_middle, b=b_middle, autojunk=False)
+        middle_opcodes = matcher.get_opcodes()
+    else:
+        middle_opcodes = _moves_to_opcodes(moves)
+    opcodes = [] if prefix_length == 0 else [("equal", 0, prefix_length, 0, prefix_length)]
+    opcodes.extend((opcode, a_start + prefix_length, a_end + prefix_length,
+                    b_start + prefix_length, b_end + prefix_length)
+                   for opcode, a_start, a_end, b_start, b_end in middle_opcodes)
+    if suffix_length > 0:
+        opcodes.append(("equal", len(a) - suffix_length, len(a),
+                        len(b) - suffix_length, len(b)))
+    return opcodes
+
+
+@functools.lru_cache(maxsize=128)
+def _get_lines(text_editor, start, end, version, theme_index):
     return (tuple(text_editor.text_widget[start:end]),
             tuple(text_editor.text_widget.appearance_interval((start, end))))
 
 
-def replace_part(a_str, start, end, part):
-    return a_str[:start] + part + a_str[end:]
+def get_lines(text_editor, start, end):
+    return _get_lines(text_editor, start, end, text_editor.text_widget.version,
+                      text_editor.theme_index)
 
 
-@functools.lru_cache(maxsize=500)
+@functools.lru_cache(maxsize=4096)
 def highlight_modification(a_lines, b_lines, show_sub_highlights):
     blue = termstr.Color.blue
     left_line = termstr.join("\n", tuple(colored_line[:len(line)]
@@ -93,15 +203,21 @@ def highlight_modification(a_lines, b_lines, show_sub_highlights):
     right_line = termstr.join("\n", tuple(colored_line[:len(line)]
                                           for line, colored_line in zip(*b_lines)))
     if show_sub_highlights:
+        white, green = termstr.Color.white, termstr.Color.green
+        left_parts, right_parts = [], []
         diff = line_diff(left_line.data, right_line.data)
         for opcode, left_start, left_end, right_start, right_end in diff:
-            color = termstr.Color.white if opcode == "replace" else termstr.Color.green
-            if opcode == "delete" or opcode == "replace":
-                part = highlight_str(left_line[left_start:left_end], color, 0.8)
-                left_line = replace_part(left_line, left_start, left_end, part)
-            if opcode == "insert" or opcode == "replace":
-                part = highlight_str(right_line[right_start:right_end], color, 0.8)
-                right_line = replace_part(right_line, right_start, right_end, part)
+            color = white if opcode == "replace" else green
+            left_part = left_line[left_start:left_end]
+            right_part = right_line[right_start:right_end]
+            if left_start < left_end and (opcode == "delete" or opcode == "replace"):
+                left_part = highlight_str(left_part, color, 0.8)
+            if right_start < right_end and (opcode == "insert" or opcode == "replace"):
+                right_part = highlight_str(right_part, color, 0.8)
+            left_parts.append(left_part)
+            right_parts.append(right_part)
+        left_line = termstr.join("", left_parts)
+        right_line = termstr.join("", right_parts)
     return ([highlight_str(line + a_line[len(line):], blue, 0.6)
              for line, a_line in zip(left_line.split("\n"), a_lines[1])],
             [highlight_str(line + b_line[len(line):], blue, 0.6)
@@ -109,7 +225,7 @@ def highlight_modification(a_lines, b_lines, show_sub_highlights):
 
 
 def draw_connector(columns, color, left_y, right_y):
-    left_arrows, line, right_arrows = columns
+    left_arrows, line_masks, right_arrows = columns
     height = len(left_arrows)
     left_corner, right_corner = ("┓", "┗") if left_y < right_y else ("┛", "┏")
     if left_y == right_y:
@@ -118,14 +234,14 @@ def draw_connector(columns, color, left_y, right_y):
                                      (right_arrows, right_y, "▸", right_corner)]:
         if 0 < y < height - 1:
             column[y] = termstr.TermStr(arrow).fg_color(color)
-            line[y] = union_box_line(corner, line[y])
+            line_masks[y] |= _LINE_MAP[corner]
     if 0 < left_y < height - 1 or 0 < right_y < height - 1:
         if left_y != right_y:
             start, end = sorted([left_y, right_y])
             start = max(start, -1)
             end = min(end, height)
             for index in range(start+1, end):
-                line[index] = union_box_line("┃", line[index])
+                line_masks[index] |= _VERTICAL_MASK
 
 
 def ranges_overlap(a, b):
@@ -133,17 +249,22 @@ def ranges_overlap(a, b):
 
 
 def overlay_list(bg_list, fg_list, index):
-    if index < 0:
-        bg_len = len(bg_list)
-        bg_list[:len(fg_list) + index] = fg_list[abs(index):]
-        bg_list[bg_len:] = []
-    else:
-        bg_list[index:index + len(fg_list)] = fg_list[:len(bg_list) - index]
+    source_start = max(0, -index)
+    destination_start = max(0, index)
+    count = min(len(fg_list) - source_start, len(bg_list) - destination_start)
+    bg_list[destination_start:destination_start+count] = \
+        fg_list[source_start:source_start+count]
     return bg_list
 
 
 class DiffEditor:
 
+    __slots__ = ("left_editor", "right_editor", "show_sub_highlights", "previous_term_code",
+                 "left_view", "right_view", "editors", "last_dimensions", "_paint_cache",
+                 "_is_paint_pending", "_appearance_key", "_appearance", "_diff_generation",
+                 "_diff", "_diff_dirty", "_left_starts", "_right_starts", "_last_drag_position",
+                 "_bound_key_map")
+
     def __init__(self, left_path, right_path):
         self.left_editor = editor.TextEditor(is_left_aligned=False)
         self.left_editor.load(left_path)
@@ -152,6 +273,18 @@ class DiffEditor:
         self.right_editor.load(right_path)
         self.show_sub_highlights = True
         self.previous_term_code = None
+        self._bound_key_map = {key: action.__get__(self)
+                               for key, action in self.KEY_MAP.items()}
+        self._last_drag_position = None
+        self._paint_cache = {}
+        self._is_paint_pending = False
+        self._appearance_key = None
+        self._appearance = None
+        self._diff_generation = 0
+        self._diff = None
+        self._diff_dirty = True
+        self._left_starts = None
+        self._right_starts = None
         left_decor = editor.Decor(self.left_editor.text_widget, self._left_highlight_lines)
         self.left_editor.decor_widget.widget = left_decor
         self.left_view = self.left_editor.view_widget
@@ -172,14 +305,55 @@ class DiffEditor:
         shutil.move(checkout_path, temp_path)
         return cls(path, temp_path)
 
-    @functools.cached_property
+    def _compute_diff(self):
+        line_ids = {}
+        left_ids = tuple(line_ids.setdefault(line, len(line_ids))
+                         for line in self.left_editor.text_widget)
+        right_ids = tuple(line_ids.setdefault(line, len(line_ids))
+                          for line in self.right_editor.text_widget)
+        return myers_diff(left_ids, right_ids)
+
+    def _set_diff(self, diff):
+        self._diff = diff
+        self._left_starts = [left_start for opcode, left_start, left_end,
+                             right_start, right_end in diff]
+        self._right_starts = [right_start for opcode, left_start, left_end,
+                              right_start, right_end in diff]
+        self._diff_dirty = False
+
+    @property
     def diff(self):
-        return difflib.SequenceMatcher(a=self.left_editor.text_widget,
-                                       b=self.right_editor.text_widget).get_opcodes()
+        if self._diff_dirty:
+            self._set_diff(self._compute_diff())
+        return self._diff
+
+    async def _update_diff(self, generation):
+        diff = await asyncio.to_thread(self._compute_diff)
+        if generation != self._diff_generation:
+            return
+        self._set_diff(diff)
+        fill3.APPEARANCE_CHANGED_EVENT.set()
 
     def diff_changed(self):
-        with contextlib.suppress(AttributeError):
-            del self.diff
+        self._diff_generation += 1
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            self._diff_dirty = True
+            return
+        asyncio.create_task(self._update_diff(self._diff_generation))
+
+    def _modification_appearances(self, opcode):
+        try:
+            return self._paint_cache[opcode]
+        except KeyError:
+            op, left_start, left_end, right_start, right_end = opcode
+            left_lines = get_lines(self.left_editor, left_start, left_end)
+            right_lines = get_lines(self.right_editor, right_start, right_end)
+            appearances = highlight_modification(left_lines, right_lines,
+                                                 self.show_sub_highlights)
+            self._paint_cache[opcode] = appearances
+            return appearances
 
     @staticmethod
     def _highlight_lines(appearance, start, end, opcode, change_opcode):
@@ -187,37 +361,40 @@ class DiffEditor:
             for index in range(start, end):
                 appearance[index] = highlight_str(appearance[index], (0, 200, 0), 0.6)
 
-    def _left_highlight_lines(self, appearance):
-        view_x, view_y = self.left_view.position
+    def _highlight_diff_lines(self, appearance, view, is_left):
+        view_x, view_y = view.position
         view_end_y = view_y + len(appearance)
-        for op, left_start, left_end, right_start, right_end in self.diff:
-            if op == "replace" and ranges_overlap((left_start, left_end), (view_y, view_end_y)):
-                left_lines = get_lines(self.left_editor, left_start, left_end)
-                right_lines = get_lines(self.right_editor, right_start, right_end)
-                left_appearance, right_appearance = highlight_modification(
-                    left_lines, right_lines, self.show_sub_highlights)
-                overlay_list(appearance, left_appearance, left_start - view_y)
-            self._highlight_lines(appearance, max(left_start, view_y) - view_y,
-                                  min(left_end, view_end_y) - view_y, op, "delete")
+        diff = self.diff
+        starts = self._left_starts if is_left else self._right_starts
+        start_index = 1 if is_left else 3
+        change_opcode = "delete" if is_left else "insert"
+        first_index = max(0, bisect.bisect_left(starts, view_y) - 1)
+        for opcode in diff[first_index:]:
+            op = opcode[0]
+            start, end = opcode[start_index], opcode[start_index+1]
+            if start >= view_end_y:
+                break
+            if op == "replace" and ranges_overlap((start, end), (view_y, view_end_y)):
+                appearances = self._modification_appearances(opcode)
+                overlay_list(appearance, appearances[0 if is_left else 1], start - view_y)
+            self._highlight_lines(appearance, max(start, view_y) - view_y,
+                                  min(end, view_end_y) - view_y, op, change_opcode)
         return appearance
 
+    def _left_highlight_lines(self, appearance):
+        return self._highlight_diff_lines(appearance, self.left_view, is_left=True)
+
     def _right_highlight_lines(self, appearance):
-        view_x, view_y = self.right_view.position
-        view_end_y = view_y + len(appearance)
-        for op, left_start, left_end, right_start, right_end in self.diff:
-            if op == "replace" and ranges_overlap((right_start, right_end), (view_y, view_end_y)):
-                left_lines = get_lines(self.left_editor, left_start, left_end)
-                right_lines = get_lines(self.right_editor, right_start, right_end)
-                left_appearance, right_appearance = highlight_modification(
-                    left_lines, right_lines, self.show_sub_highlights)
-                overlay_list(appearance, right_appearance, right_start - view_y)
-            self._highlight_lines(appearance, max(right_start, view_y) - view_y,
-                                  min(right_end, view_end_y) - view_y, op, "insert")
-        return appearance
+        return self._highlight_diff_lines(appearance, self.right_view, is_left=False)
 
     def _equivalent_line(self, y):
-        for opcode, left_start, left_end, right_start, right_end in self.diff:
-            if self.editors[0] == self.right_editor:
+        diff = self.diff
+        is_swapped = self.editors[0] == self.right_editor
+        starts = self._right_starts if is_swapped else self._left_starts
+        index = bisect.bisect_right(starts, y) - 1
+        if index >= 0:
+            opcode, left_start, left_end, right_start, right_end = diff[index]
+            if is_swapped:
                 left_start, left_end, right_start, right_end = \
                     right_start, right_end, left_start, left_end
             if left_start <= y < left_end:
@@ -322,23 +499,53 @@ class DiffEditor:
         for editor_ in self.editors:
             editor_.cycle_syntax_highlighting()
 
+    _PAINT_INTERVAL = 1 / 60
+
+    def _fire_paint(self):
+        self._is_paint_pending = False
+        fill3.APPEARANCE_CHANGED_EVENT.set()
+
+    def _schedule_paint(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            fill3.APPEARANCE_CHANGED_EVENT.set()
+            return
+        if not self._is_paint_pending:
+            self._is_paint_pending = True
+            loop.call_later(self._PAINT_INTERVAL, self._fire_paint)
+
+    def _input_state(self):
+        return (self.left_editor._input_state(), self.right_editor._input_state(),
+                self.editors[0] is self.left_editor, self.show_sub_highlights)
+
     def on_keyboard_input(self, term_code):
-        if action := (self.KEY_MAP.get((self.previous_term_code, term_code))
-                      or self.KEY_MAP.get(term_code)):
-            action(self)
+        state_before = self._input_state()
+        focused_editor = self.editors[0]
+        old_version = focused_editor.text_widget.version
+        action = (self._bound_key_map.get((self.previous_term_code, term_code))
+                  if self.previous_term_code in self._PREFIX_KEYS else None)
+        if action := action or self._bound_key_map.get(term_code):
+            action()
         else:
-            old_version = self.editors[0].text_widget.version
-            self.editors[0].on_keyboard_input(term_code)
-            if self.editors[0].text_widget.version != old_version:
-                self.diff_changed()
+            focused_editor.on_keyboard_input(term_code)
+        if focused_editor.text_widget.version != old_version:
+            self.diff_changed()
         self.previous_term_code = term_code
-        fill3.APPEARANCE_CHANGED_EVENT.set()
+        if self._input_state() != state_before:
+            self._schedule_paint()
 
     def on_mouse_input(self, term_code):
         action, flag, x, y = terminal.decode_mouse_input(term_code)
+        if action == terminal.MOUSE_DRAG:
+            if (x, y) == self._last_drag_position:
+                return
+            self._last_drag_position = (x, y)
+        else:
+            self._last_drag_position = None
         if action in [terminal.MOUSE_PRESS, terminal.MOUSE_DRAG, terminal.MOUSE_RELEASE]:
             self.on_mouse_event(action, x, y)
-            fill3.APPEARANCE_CHANGED_EVENT.set()
+            self._schedule_paint()
 
     _ARROW_COLORS = [termstr.Color.yellow, termstr.Color.green, termstr.Color.red,
                      termstr.Color.light_blue, termstr.Color.purple, termstr.Color.orange,
@@ -348,16 +555,15 @@ class DiffEditor:
         left_scroll = self.left_view.position[1]
         right_scroll = self.right_view.position[1]
         left_arrows = [" "] * height
-        line = [" "] * height
+        line_masks = [0] * height
         right_arrows = [" "] * height
-        columns = [left_arrows, line, right_arrows]
-        color_index = 0
-        colors = self._ARROW_COLORS
+        columns = [left_arrows, line_masks, right_arrows]
+        colors = itertools.cycle(self._ARROW_COLORS)
         has_top_mark, has_bottom_mark = False, False
         for opcode, left_start, left_end, right_start, right_end in self.diff:
             if opcode == "equal":
                 continue
-            color = colors[color_index % len(colors)]
+            color = next(colors)
             left_y = left_start - left_scroll + self.left_editor.parts_height + 1  # 1 for header
             right_y = right_start - right_scroll + self.right_editor.parts_height + 1
             draw_connector(columns, color, left_y, right_y)
@@ -366,16 +572,34 @@ class DiffEditor:
                     has_top_mark = True
                 elif y >= height - 1:
                     has_bottom_mark = True
-            color_index += 1
+        line = [_LINE_MAP_INVERTED[mask] for mask in line_masks]
         if has_top_mark:
             line[0] = "↑"
         if has_bottom_mark:
             line[-1] = "↓"
-        return columns
+        return [left_arrows, line, right_arrows]
+
+    @staticmethod
+    def _editor_render_state(editor_):
+        parts_widget = editor_.parts_widget
+        return (editor_.text_widget.version, editor_._cursor_x, editor_._cursor_y,
+                editor_.mark, editor_.theme_index, editor_.scroll_position,
+                editor_.is_editing, editor_.is_overwriting, editor_.saved_version,
+                None if parts_widget is None else parts_widget.cursor)
 
     def appearance_for(self, dimensions):
         width, height = self.last_dimensions = dimensions
         self.follow_scroll()
+        key = (dimensions, self.editors[0] is self.left_editor, self.show_sub_highlights,
+               id(self._diff),
+               self._editor_render_state(self.left_editor),
+               self._editor_render_state(self.right_editor))
+        if key == self._appearance_key:
+            return self._appearance
+        self._paint_cache.clear()
+        # The pane appearances bake in diff decor, which the editors' own memo keys don't cover.
+        self.left_editor._appearance_key = None
+        self.right_editor._appearance_key = None
         divider_width = 3
         left_width = (width - divider_width) // 2
         right_width = width - divider_width - left_width
@@ -384,13 +608,17 @@ class DiffEditor:
         inactive_appearance = (right_appearance if self.left_editor is self.editors[0]
                                else left_appearance)
         inactive_appearance[0] = highlight_str(inactive_appearance[0], termstr.Color.black, 0.5)
-        return fill3.join_horizontal(
+        self._appearance = fill3.join_horizontal(
             [left_appearance] + self.divider_appearance(height) + [right_appearance])
+        self._appearance_key = key
+        return self._appearance
 
     KEY_MAP = {(terminal.CTRL_X, "o"): switch_editor, terminal.ALT_o: switch_editor,
                terminal.ALT_h: toggle_highlights, terminal.ALT_DOWN: jump_to_next_diff,
                terminal.ALT_UP: jump_to_previous_diff, terminal.ALT_c: cycle_syntax_highlighting}
 
+    _PREFIX_KEYS = frozenset(key[0] for key in KEY_MAP if type(key) is tuple)
+
 
 def check_arguments():
     arguments = docopt.docopt(USAGE)
@@ -2,12 +2,16 @@
 # -*- coding: utf-8 -*-
 
 
+import array
 import asyncio
+import bisect
+import collections
 import contextlib
 import enum
 import functools
+import itertools
 import os
-import string
+import re
 import sys
 
 import fill3
@@ -22,21 +26,25 @@ import termstr
 import cwcwidth
 
 
-@functools.lru_cache(maxsize=100)
+@functools.lru_cache(maxsize=4096)
+def blend_char_style(style, bg_color, transparency):
+    return termstr.CharStyle(termstr.blend_color(style.fg_rgb_color, bg_color, transparency),
+                             termstr.blend_color(style.bg_rgb_color, bg_color, transparency),
+                             is_bold=style.is_bold, is_italic=style.is_italic,
+                             is_underlined=style.is_underlined)
+
+
 def highlight_str(line, bg_color, transparency=0.6):
-    def blend_style(style):
-        return termstr.CharStyle(termstr.blend_color(style.fg_rgb_color, bg_color, transparency),
-                                 termstr.blend_color(style.bg_rgb_color, bg_color, transparency),
-                                 is_bold=style.is_bold, is_italic=style.is_italic,
-                                 is_underlined=style.is_underlined)
-    return termstr.TermStr(line).transform_style(blend_style)
+    if not isinstance(line, termstr.TermStr):
+        line = termstr.TermStr(line)
+    return line.transform_style(
+        lambda style: blend_char_style(style, bg_color, transparency))
 
 
 @functools.lru_cache(maxsize=500)
 def parse_rgb(hex_rgb):
-    if hex_rgb.startswith("#"):
-        hex_rgb = hex_rgb[1:]
-    return tuple(int("0x" + hex_rgb[index:index+2], base=16) for index in [0, 2, 4])
+    value = int(hex_rgb.lstrip("#"), 16)
+    return value >> 16 & 0xFF, value >> 8 & 0xFF, value & 0xFF
 
 
 @functools.cache
@@ -50,10 +58,13 @@ def highlight_line(line, theme=None):
     return highlight_str(line, blend_color, 0.8)
 
 
-NATIVE_STYLE = pygments.styles.get_style_by_name("paraiso-dark")
+get_style_by_name = functools.cache(pygments.styles.get_style_by_name)
 
 
-@functools.lru_cache(maxsize=500)
+NATIVE_STYLE = get_style_by_name("paraiso-dark")
+
+
+@functools.cache
 def char_style_for_token_type(token_type, style):
     default_bg_color = parse_rgb(style.background_color)
     default_style = termstr.CharStyle(bg_color=default_bg_color)
@@ -69,21 +80,51 @@ def char_style_for_token_type(token_type, style):
                              token_style["underline"])
 
 
+@functools.cache
+def _style_table(style):
+    return {}
+
+
 def syntax_highlight(text, lexer, style):
     text = expandtabs(text)
-    text = termstr.join("", [termstr.TermStr(text, char_style_for_token_type(token_type, style))
-                             for token_type, text in pygments.lex(text, lexer)])
+    parts = []
+    style_table = _style_table(style)
+    run_style, run_texts = None, []
+    for token_type, token_text in pygments.lex(text, lexer):
+        try:
+            char_style = style_table[token_type]
+        except KeyError:
+            char_style = style_table[token_type] = \
+                char_style_for_token_type(token_type, style)
+        if char_style is run_style:
+            run_texts.append(token_text)
+        else:
+            if run_texts:
+                parts.append(termstr.TermStr("".join(run_texts), run_style))
+            run_style, run_texts = char_style, [token_text]
+    if run_texts:
+        parts.append(termstr.TermStr("".join(run_texts), run_style))
+    text = termstr.join("", parts)
     bg_color = parse_rgb(style.background_color)
     text_widget = fill3.Text(text, pad_char=termstr.TermStr(" ").bg_color(bg_color))
     return termstr.join("\n", text_widget.text)
 
 
 @functools.lru_cache(maxsize=5000)
-def expand_str(str_):
+def _expand_str_slow(str_):
     expanded_str = termstr.TermStr(str_)
     return str_ if expanded_str.data == str_ else expanded_str
 
 
+def expand_str(str_):
+    return str_ if str_.isascii() and "\t" not in str_ else _expand_str_slow(str_)
+
+
+@functools.lru_cache(maxsize=5000)
+def expand_str_len(str_):
+    return len(str_) if str_.isascii() and "\t" not in str_ else len(expand_str(str_))
+
+
 class Text:
 
     def __init__(self, text):
@@ -92,37 +133,69 @@ class Text:
             lines.append("")
         self.version = 0
         self.lines = lines
+        self.edits = []
 
     def __len__(self):
         return len(self.lines)
 
     @functools.cached_property
     def max_line_length(self):
-        return max(len(expand_str(line)) for line in self.lines)
+        return max(expand_str_len(line) for line in self.lines)
 
     def _new_line(self, line):
-        self.max_line_length = max(self.max_line_length, len(expand_str(line)))
+        self.max_line_length = max(self.max_line_length, expand_str_len(line))
         self.version += 1
 
     def __getitem__(self, line_index):
         return self.lines[line_index]
 
     def __setitem__(self, key, value):
-        if type(key) == int and \
-           len(expand_str(self.lines[key])) != self.max_line_length:
-            self.lines[key] = value
-            self._new_line(value)
+        if type(key) == int:
+            index = key if key >= 0 else key + len(self.lines)
+            self.edits.append((index, [self.lines[key]], [value]))
+            if "max_line_length" in self.__dict__:
+                max_line_length = self.max_line_length
+                old_width = expand_str_len(self.lines[key])
+                self.lines[key] = value
+                new_width = expand_str_len(value)
+                if new_width >= max_line_length:
+                    self.max_line_length = new_width
+                elif old_width == max_line_length:
+                    del self.max_line_length
+            else:
+                self.lines[key] = value
+            self.version += 1
         else:
+            start, stop, step = key.indices(len(self.lines))
+            value = list(value)
+            self.edits.append((start, self.lines[key], value))
             self.lines[key] = value
             with contextlib.suppress(AttributeError):
                 del self.max_line_length
             self.version += 1
 
+    def bulk_setitem(self, updates):
+        if not updates:
+            return
+        for index, value in updates:
+            if index < 0:
+                index += len(self.lines)
+            self.edits.append((index, [self.lines[index]], [value]))
+            self.lines[index] = value
+        with contextlib.suppress(AttributeError):
+            del self.max_line_length
+        self.version += 1
+
     def insert(self, index, line):
+        if index < 0:
+            index += len(self.lines)
+        index = min(max(index, 0), len(self.lines))
+        self.edits.append((index, [], [line]))
         self.lines.insert(index, line)
         self._new_line(line)
 
     def append(self, line):
+        self.edits.append((len(self.lines), [], [line]))
         self.lines.append(line)
         self._new_line(line)
 
@@ -135,7 +208,7 @@ class Text:
         return expand_str(line).ljust(max_line_length)
 
     def appearance(self):
-        return [self._convert_line(line, self.max_line_length) for line in self.lines]
+        return self.appearance_interval((0, len(self.lines)))
 
     def appearance_dimensions(self):
         return (self.max_line_length, len(self.lines))
@@ -146,24 +219,39 @@ class Text:
                 for line in self.lines[start_y:end_y]]
 
 
+@functools.cache
+def padding_char(lexer, theme):
+    return syntax_highlight(" ", lexer, theme)
+
+
+@functools.lru_cache(maxsize=100)
+def lexer_for_path(path, code_sample):
+    try:
+        return pygments.lexers.get_lexer_for_filename(path, code_sample)
+    except pygments.util.ClassNotFound:
+        return pygments.lexers.special.TextLexer()
+
+
 class Code(Text):
 
     def __init__(self, text, path, theme=NATIVE_STYLE):
-        try:
-            self.lexer = pygments.lexers.get_lexer_for_filename(path, text)
-        except pygments.util.ClassNotFound:
-            self.lexer = pygments.lexers.special.TextLexer()
+        self.lexer = lexer_for_path(path, text[:4096])
         self.theme = theme
+        self._line_cache = {}
         Text.__init__(self, text)
 
-    @functools.lru_cache(maxsize=5000)
-    def _convert_line_themed(self, line, max_line_length, theme):
-        padding_char = syntax_highlight(" ", self.lexer, self.theme)
-        highlighted_line = syntax_highlight(line, self.lexer, theme)
-        return highlighted_line.ljust(max_line_length, fillchar=padding_char)
-
     def _convert_line(self, line, max_line_length):
-        return self._convert_line_themed(line, max_line_length, self.theme)
+        key = line, max_line_length, self.theme
+        try:
+            return self._line_cache[key]
+        except KeyError:
+            if len(self._line_cache) > 5000:
+                self._line_cache.clear()
+            highlighted_line = syntax_highlight(line, self.lexer, self.theme)
+            result = highlighted_line.ljust(max_line_length,
+                                            fillchar=padding_char(self.lexer, self.theme))
+            self._line_cache[key] = result
+            return result
 
 
 class Decor:
@@ -186,12 +274,16 @@ class Decor:
 
 
 def highlight_part(line, start, end):
-    return (line[:start] + highlight_str(line[start:end], termstr.Color.white, transparency=0.7) +
-            line[end:])
+    highlighted = highlight_str(line[start:end], termstr.Color.white, transparency=0.7)
+    return line[:start] + highlighted + line[end:]
 
 
 @functools.lru_cache(maxsize=5000)
 def expandtabs(text):
+    if "\t" not in text:
+        return text
+    if text.isascii():
+        return text.expandtabs(8)
     result = []
     for line in text.splitlines(keepends=True):
         parts = line.split("\t")
@@ -199,17 +291,17 @@ def expandtabs(text):
             result.append(line)
             continue
         result.append(parts[0])
-        line_length = cwcwidth.wcswidth(parts[0])
+        line_length = len(parts[0]) if parts[0].isascii() else cwcwidth.wcswidth(parts[0])
         for part in parts[1:]:
             spacing = 8 - line_length % 8
             result.extend([" " * spacing, part])
-            line_length += spacing + cwcwidth.wcswidth(part)
+            line_length += spacing + (len(part) if part.isascii() else cwcwidth.wcswidth(part))
     return "".join(result)
 
 
 @functools.lru_cache(maxsize=5000)
 def expand_str_inverse(str_):
-    result = []
+    result = array.array("i")
     for index, char in enumerate(str_):
         run_length = 8 - len(result) % 8 if char == "\t" else cwcwidth.wcwidth(char)
         result.extend([index] * run_length)
@@ -229,6 +321,10 @@ def _wrap_text_lines(words, width):
     yield words[first_word:]
 
 
+def wrap_text_height(words, width):
+    return sum(1 for line in _wrap_text_lines(words, width))
+
+
 def wrap_text(words, width, pad_char=" "):
     appearance = []
     coords = []
@@ -245,23 +341,25 @@ def wrap_text(words, width, pad_char=" "):
 
 @functools.lru_cache(100)
 def parts_lines(source, lexer, theme):
-    cursor = 0
     line_num = 0
-    line_lengths = [len(line) for line in source.splitlines(keepends=True)]
+    offsets = array.array("i", itertools.accumulate(
+        len(line) for line in source.splitlines(keepends=True)))
     white_style = termstr.CharStyle(fg_color=termstr.Color.white)
     result = [(termstr.TermStr("top", white_style), 0)]
     token_types = {pygments.token.Name.Class, pygments.token.Name.Function,
                    pygments.token.Name.Function.Magic}
     if lexer is None:
-        line_num = len(source.splitlines())
+        line_num = len(offsets)
     else:
+        last_position = 0
         for position, token_type, text in lexer.get_tokens_unprocessed(source):
-            while position >= cursor:
-                cursor += line_lengths[line_num]
-                line_num += 1
+            last_position = position
             if token_type in token_types:
                 char_style = char_style_for_token_type(token_type, theme)
+                line_num = bisect.bisect_right(offsets, position) + 1
                 result.append((termstr.TermStr(text, char_style), line_num - 1))
+        if offsets:
+            line_num = bisect.bisect_right(offsets, last_position) + 1
     result.append((termstr.TermStr("bottom", white_style), line_num - 1))
     return result
 
@@ -272,18 +370,18 @@ class Parts:
         self.editor = editor
         self.source = source
         self.lexer = lexer
-        self.lines = parts_lines(source, lexer, editor.text_widget.theme)
+        self._lines_theme = editor.text_widget.theme
+        self.lines = parts_lines(source, lexer, self._lines_theme)
+        self._line_nums = [line_num for text, line_num in self.lines]
+        self._display_parts = None
+        self._displayed_cursor = None
         self.width, self.height = None, None
         self.is_focused = True
+        self._appearance_key = None
         self.set_cursor()
 
     def set_cursor(self):
-        for index, (text, line_num) in enumerate(self.lines):
-            if line_num > self.editor.cursor_y:
-                self.cursor = index - 1
-                break
-        else:
-            self.cursor = len(self.lines) - 1
+        self.cursor = max(0, bisect.bisect_right(self._line_nums, self.editor.cursor_y) - 1)
 
     def _move_cursor(self, delta):
         self.cursor = (self.cursor + delta) % len(self.lines)
@@ -316,13 +414,25 @@ class Parts:
 
     def appearance(self):
         width, height = self.dimensions
-        lines = parts_lines(self.source, self.lexer, self.editor.text_widget.theme)
-        parts = [text for text, line_num in lines]
-        parts[self.cursor] = parts[self.cursor].invert()
-        pad_char = syntax_highlight(" ", self.editor.text_widget.lexer,
-                                    self.editor.text_widget.theme)
-        result, coords = wrap_text(parts, width, pad_char)
-        if len(result) > height:
+        theme = self.editor.text_widget.theme
+        key = (self.cursor, self.dimensions, theme, self.is_focused)
+        if key == self._appearance_key:
+            return self._appearance
+        if theme is not self._lines_theme:
+            self.lines = parts_lines(self.source, self.lexer, theme)
+            self._lines_theme = theme
+            self._display_parts = None
+        if self._display_parts is None:
+            self._display_parts = [text for text, line_num in self.lines]
+            self._displayed_cursor = None
+        parts = self._display_parts
+        if self._displayed_cursor != self.cursor:
+            if self._displayed_cursor is not None:
+                parts[self._displayed_cursor] = self.lines[self._displayed_cursor][0]
+            parts[self.cursor] = parts[self.cursor].invert()
+            self._displayed_cursor = self.cursor
+        pad_char = padding_char(self.editor.text_widget.lexer, self.editor.text_widget.theme)
+        if wrap_text_height(parts, width) > height:
             appearance, coords = wrap_text(parts, width - 1, pad_char)
             line_num = coords[self.cursor][0] // (width - 1)
             if self.is_focused:
@@ -335,25 +445,52 @@ class Parts:
                 view_widget.portal.limit_scroll(self.dimensions, (width, len(appearance)))
             result = view_widget.appearance_for(self.dimensions)
         else:
+            result, coords = wrap_text(parts, width, pad_char)
             if self.is_focused:
                 line_num = coords[self.cursor][0] // width
                 result[line_num] = highlight_line(result[line_num], self.editor.text_widget.theme)
         fg_color = termstr.Color.grey_100
         bg_color = parse_rgb(self.editor.text_widget.theme.background_color)
         result.append(termstr.TermStr("─").bg_color(bg_color).fg_color(fg_color) * width)
+        self._appearance_key, self._appearance = key, result
         return result
 
 
+def _key_dispatch_tables(key_map):
+    single, multi = [None] * 128, {}
+    for key, action in key_map.items():
+        if type(key) is tuple:
+            continue
+        if len(key) == 1 and ord(key) < 128:
+            single[ord(key)] = action
+        else:
+            multi[key] = action
+    return single, multi
+
+
+@functools.lru_cache(maxsize=100)
+def colored_path(path, is_changed):
+    return lscolors.path_colored(path) + ("*" if is_changed else "")
+
+
+@functools.lru_cache(maxsize=500)
+def cursor_position_str(cursor_x, cursor_y):
+    return termstr.TermStr(
+        f"Line {cursor_y+1} Column {cursor_x+1:<3}").fg_color(termstr.Color.grey_100)
+
+
 class TextEditor:
 
     TAB_SIZE = 4
-    THEMES = [pygments.styles.get_style_by_name(style)
+    THEMES = [get_style_by_name(style)
               for style in ["material", "monokai", "fruity", "native", "inkpot", "solarized-light",
                              "manni", "gruvbox-light", "perldoc", "zenburn",  "friendly",]]
 
     def __init__(self, text="", path="Untitled", is_left_aligned=True):
         self.path = os.path.normpath(path)
         self.is_left_aligned = is_left_aligned
+        self._cursor_x_key = None
+        self._appearance_key = None
         self.set_text(text)
         self.mark = None
         self.clipboard = None
@@ -365,19 +502,31 @@ class TextEditor:
         self.previous_term_code = None
         self.last_mouse_position = 0, 0
         self.parts_widget = None
+        self._single_key_actions = [None if action is None else action.__get__(self)
+                                    for action in TextEditor._SINGLE_KEY_ACTIONS]
+        self._multi_key_actions = {key: action.__get__(self)
+                                   for key, action in TextEditor._MULTI_KEY_ACTIONS.items()}
+        self._chord_actions = {key: action.__get__(self)
+                               for key, action in TextEditor.KEY_MAP.items()
+                               if type(key) is tuple}
 
     def screen_x(self, x, y):
-        return len(expand_str(self.text_widget[y][:x]))
+        return expand_str_len(self.text_widget[y][:x])
 
     def model_x(self, x, y):
         return expand_str_inverse(self.text_widget[y])[x]
 
     @property
     def cursor_x(self):
+        key = (id(self.text_widget), self.text_widget.version, self._cursor_x, self._cursor_y)
+        if key == self._cursor_x_key:
+            return self._cursor_x_value
         try:
-            return self.model_x(self._cursor_x, self.cursor_y)
+            value = self.model_x(self._cursor_x, self.cursor_y)
         except IndexError:
-            return len(self.text_widget.lines[self.cursor_y])
+            value = len(self.text_widget.lines[self.cursor_y])
+        self._cursor_x_key, self._cursor_x_value = key, value
+        return value
 
     @cursor_x.setter
     def cursor_x(self, x):
@@ -432,9 +581,12 @@ class TextEditor:
 
     def _highlight_cursor(self, appearance, cursor_y):
         cursor_line = appearance[cursor_y]
-        screen_x = self.screen_x(self.cursor_x, self.cursor_y)
-        screen_x_after = (screen_x + 1 if self._current_character() in ["\t", "\n"] else
-                          self.screen_x(self.cursor_x + 1, self.cursor_y))
+        line = self.text_widget[self.cursor_y]
+        cursor_x = self.cursor_x
+        character = line[cursor_x] if cursor_x < len(line) else "\n"
+        screen_x = expand_str_len(line[:cursor_x])
+        screen_x_after = (screen_x + 1 if character in ["\t", "\n"] else
+                          expand_str_len(line[:cursor_x+1]))
         appearance[cursor_y] = (cursor_line[:screen_x] +
                                 termstr.TermStr(cursor_line[screen_x:screen_x_after]).invert() +
                                 cursor_line[screen_x_after:])
@@ -464,8 +616,8 @@ class TextEditor:
         if not self.is_left_aligned:
             self.view_widget.portal.x_alignment = fill3.Alignment.right
         self._cursor_x, self._cursor_y = 0, 0
-        self.original_text = self.text_widget.lines.copy()
-        self.history = []
+        self.saved_version = self.text_widget.version
+        self.history = collections.deque(maxlen=1000)
         self.history_position = 0
         self.add_to_history()
 
@@ -477,7 +629,7 @@ class TextEditor:
     def save(self):
         with open(self.path, "w") as file_:
             file_.write(self.text_widget.get_text())
-        self.original_text = self.text_widget.lines.copy()
+        self.saved_version = self.text_widget.version
 
     def backspace(self):
         if self.cursor_x == 0:
@@ -537,9 +689,6 @@ class TextEditor:
     def set_mark(self):
         self.mark = self.cursor_x, self.cursor_y
 
-    def drop_highlight(self):
-        self.mark = None
-
     def copy_selection(self):
         if self.mark is not None:
             (start_x, start_y), (end_x, end_y) = self.get_selection_interval()
@@ -562,9 +711,10 @@ class TextEditor:
     def insert_text(self, text, is_overwriting=False):
         try:
             current_line = self.text_widget[self.cursor_y]
+            cursor_x = self.cursor_x
             replace_count = len(text) if is_overwriting else 0
-            self.text_widget[self.cursor_y] = (current_line[:self.cursor_x] + text
-                                               + current_line[self.cursor_x+replace_count:])
+            self.text_widget[self.cursor_y] = \
+                f"{current_line[:cursor_x]}{text}{current_line[cursor_x+replace_count:]}"
         except IndexError:
             self.text_widget.append(text)
         self.cursor_x += len(text)
@@ -580,28 +730,43 @@ class TextEditor:
 
     def paste_from_clipboard(self):
         if self.clipboard is not None:
-            for line in self.clipboard[:-1]:
-                self.insert_text(line)
-                self.enter()
-            self.insert_text(self.clipboard[-1])
+            clipboard = self.clipboard
+            cursor_x, cursor_y = self.cursor_x, self.cursor_y
+            try:
+                current_line = self.text_widget[cursor_y]
+            except IndexError:
+                current_line = ""
+            new_lines = [current_line[:cursor_x] + clipboard[0]]
+            new_lines.extend(clipboard[1:-1])
+            if len(clipboard) == 1:
+                new_lines[0] += current_line[cursor_x:]
+            else:
+                new_lines.append(clipboard[-1] + current_line[cursor_x:])
+            self.text_widget[cursor_y:cursor_y+1] = new_lines
+            self.cursor_y = cursor_y + len(clipboard) - 1
+            self.cursor_x = (cursor_x + len(clipboard[0]) if len(clipboard) == 1
+                             else len(clipboard[-1]))
 
     def _is_on_empty_line(self):
         return self.text_widget[self.cursor_y].strip() == ""
 
-    def _jump_to_block_edge(self, direction_func):
+    def _jump_to_block_edge(self, step):
         self.jump_to_start_of_line()
-        while self._is_on_empty_line():
-            direction_func()
-        while not self._is_on_empty_line():
-            direction_func()
+        lines = self.text_widget.lines
+        y = self.cursor_y
+        for is_empty in [True, False]:
+            while (lines[y].strip() == "") == is_empty:
+                y += step
+                if not 0 <= y < len(lines):
+                    self.cursor_y = y - step
+                    raise IndexError
+        self.cursor_y = y
 
     def jump_to_block_start(self):
-        return self._jump_to_block_edge(self.cursor_up)
+        return self._jump_to_block_edge(-1)
 
     def jump_to_block_end(self):
-        return self._jump_to_block_edge(self.cursor_down)
-
-    WORD_CHARS = string.ascii_letters + string.digits
+        return self._jump_to_block_edge(1)
 
     def _current_character(self):
         try:
@@ -609,19 +774,39 @@ class TextEditor:
         except IndexError:
             return "\n"
 
+    _WORD_RE = re.compile("[a-zA-Z0-9]+")
+
     def next_word(self):
-        while self._current_character() not in TextEditor.WORD_CHARS:
-            self.cursor_right()
-        while self._current_character() in TextEditor.WORD_CHARS:
-            self.cursor_right()
+        x, y = self.cursor_x, self.cursor_y
+        while y < len(self.text_widget):
+            match = TextEditor._WORD_RE.search(self.text_widget[y], x)
+            if match is not None:
+                self.cursor_y = y
+                self.cursor_x = match.end()
+                return
+            x, y = 0, y + 1
+        self.cursor_y = len(self.text_widget) - 1
+        self.cursor_x = len(self.text_widget[self.cursor_y])
+        raise IndexError
 
     def previous_word(self):
-        self.cursor_left()
-        while self._current_character() not in TextEditor.WORD_CHARS:
-            self.cursor_left()
-        while self._current_character() in TextEditor.WORD_CHARS:
-            self.cursor_left()
-        self.cursor_right()
+        x, y = self.cursor_x, self.cursor_y
+        while True:
+            match = None
+            for match in TextEditor._WORD_RE.finditer(self.text_widget[y], 0, x):
+                pass
+            if match is not None:
+                self.cursor_y = y
+                self.cursor_x = match.start()
+                if match.start() == 0 and y == 0:
+                    raise IndexError
+                return
+            y -= 1
+            if y < 0:
+                self.cursor_y = 0
+                self.cursor_x = 0
+                raise IndexError
+            x = len(self.text_widget[y])
 
     def delete_backward(self):
         self.set_mark()
@@ -700,17 +885,19 @@ class TextEditor:
             except ValueError:
                 pass
             else:
+                updates = []
                 if all(self.text_widget[y][min_indent:min_indent+2] == "# "
                        or self.text_widget[y].strip() == "" for y in mid_lines):
                     for y in mid_lines:
                         line = self.text_widget[y]
                         if line.strip() != "":
-                            self.text_widget[y] = line[:min_indent] + line[min_indent + 2:]
+                            updates.append((y, line[:min_indent] + line[min_indent + 2:]))
                 else:
                     for y in mid_lines:
                         line = self.text_widget[y]
                         if line.strip() != "":
-                            self.text_widget[y] = line[:min_indent] + "# " + line[min_indent:]
+                            updates.append((y, line[:min_indent] + "# " + line[min_indent:]))
+                self.text_widget.bulk_setitem(updates)
             self.mark = None
 
     def join_lines(self):
@@ -739,6 +926,7 @@ class TextEditor:
 
     def quit(self):
         fill3.SHUTDOWN_EVENT.set()
+        fill3.APPEARANCE_CHANGED_EVENT.set()
 
     def show_parts_list(self):
         lexer = getattr(self.text_widget, "lexer", None)
@@ -750,26 +938,43 @@ class TextEditor:
         if "unittest" not in sys.modules:
             print("\a", end="")
 
-    def add_to_history(self, state=None):
-        if state is None:
-            lines = self.text_widget.lines.copy()
-            cursor_x, cursor_y = self._cursor_x, self._cursor_y
-        else:
-            lines, cursor_x, cursor_y = state
+    @staticmethod
+    def _invert_record(record):
+        edits, cursor_before, cursor_after = record
+        inverted_edits = [(start, new_lines, old_lines)
+                          for start, old_lines, new_lines in reversed(edits)]
+        return inverted_edits, cursor_after, cursor_before
+
+    def add_to_history(self, cursor=None):
+        edits = self.text_widget.edits
+        if not edits:
+            self._pending_cursor = self._cursor_x, self._cursor_y
+            return
+        if cursor is None:
+            cursor = self._pending_cursor
+        record = (list(edits), cursor, (self._cursor_x, self._cursor_y))
+        edits.clear()
         if self.history_position < len(self.history):
-            self.history.extend(reversed(self.history[self.history_position:-1]))
-        self.history.append((lines, cursor_x, cursor_y))
+            redo_records = list(itertools.islice(self.history, self.history_position, None))
+            self.history.extend(self._invert_record(record_)
+                                for record_ in reversed(redo_records))
+        self.history.append(record)
         self.history_position = len(self.history)
+        self._pending_cursor = self._cursor_x, self._cursor_y
 
     def undo(self):
+        if self.text_widget.edits:
+            self.add_to_history()
         if self.history_position == 0:
             self.ring_bell()
             return
-        if self.history_position == len(self.history):
-            self.add_to_history()
-            self.history_position -= 1
         self.history_position -= 1
-        self.text_widget[:], self._cursor_x, self._cursor_y = self.history[self.history_position]
+        edits, cursor_before, cursor_after = self.history[self.history_position]
+        for start, old_lines, new_lines in reversed(edits):
+            self.text_widget[start:start+len(new_lines)] = old_lines
+        self.text_widget.edits.clear()
+        self._cursor_x, self._cursor_y = cursor_before
+        self._pending_cursor = cursor_before
         self.mark = None
 
     def toggle_overwrite(self):
@@ -784,13 +989,18 @@ class TextEditor:
 
     def indent(self):
         indent_ = " " * TextEditor.TAB_SIZE
+        updates = []
+        is_cursor_line_indented = False
         for line_num in self._work_lines():
             if self.text_widget[line_num].strip() == "":
-                self.text_widget[line_num] = ""
+                updates.append((line_num, ""))
                 continue
-            self.text_widget[line_num] = indent_ + self.text_widget[line_num]
+            updates.append((line_num, indent_ + self.text_widget[line_num]))
             if self.cursor_y == line_num:
-                self.cursor_x += TextEditor.TAB_SIZE
+                is_cursor_line_indented = True
+        self.text_widget.bulk_setitem(updates)
+        if is_cursor_line_indented:
+            self.cursor_x += TextEditor.TAB_SIZE
 
     def dedent(self):
         indent_ = " " * TextEditor.TAB_SIZE
@@ -799,13 +1009,15 @@ class TextEditor:
                    or self.text_widget[line_num].strip() == "" for line_num in line_nums):
             self.ring_bell()
             return
+        updates = []
         for line_num in line_nums:
             if self.cursor_y == line_num:
                 self.cursor_x = max(self.cursor_x - TextEditor.TAB_SIZE, 0)
             if self.text_widget[line_num].strip() == "":
-                self.text_widget[line_num] = ""
+                updates.append((line_num, ""))
                 continue
-            self.text_widget[line_num] = self.text_widget[line_num][TextEditor.TAB_SIZE:]
+            updates.append((line_num, self.text_widget[line_num][TextEditor.TAB_SIZE:]))
+        self.text_widget.bulk_setitem(updates)
 
     def abort_command(self):
         self.mark = None
@@ -831,27 +1043,39 @@ class TextEditor:
             new_x = view_x
         self.view_widget.position = max(0, new_x), max(0, new_y)
 
+    def _input_state(self):
+        return (self.text_widget.version, self._cursor_x, self._cursor_y, self.mark,
+                self.scroll_position, self.is_editing, self.is_overwriting, self.theme_index,
+                self.saved_version, self.parts_widget)
+
     def on_keyboard_input(self, term_code):
         if self.parts_widget is not None:
             self.parts_widget.on_keyboard_input(term_code)
             return
+        state_before = self._input_state()
         old_version = self.text_widget.version
-        lines_before = self.text_widget.lines.copy()
-        cursor_x_before, cursor_y_before = self._cursor_x, self._cursor_y
-        if action := (TextEditor.KEY_MAP.get((self.previous_term_code, term_code))
-                      or TextEditor.KEY_MAP.get(term_code)):
+        cursor_before = self._cursor_x, self._cursor_y
+        action = (self._chord_actions.get((self.previous_term_code, term_code))
+                  if self.previous_term_code in TextEditor._PREFIX_KEYS else None)
+        if action is None:
+            action = (self._single_key_actions[ord(term_code)]
+                      if len(term_code) == 1 and ord(term_code) < 128
+                      else self._multi_key_actions.get(term_code))
+        if action is not None:
             try:
-                action(self)
+                action()
             except IndexError:
                 self.ring_bell()
         elif not (len(term_code) == 1 and ord(term_code) < 32):
             self.insert_text(term_code, is_overwriting=self.is_overwriting)
-        if self.text_widget.version != old_version and action != TextEditor.undo:
-            self.add_to_history((lines_before, cursor_x_before, cursor_y_before))
+        if (self.text_widget.version != old_version
+                and (action is None or action.__func__ is not TextEditor.undo)):
+            self.add_to_history(cursor_before)
             self.mark = None
         self.previous_term_code = term_code
-        self.follow_cursor()
-        fill3.APPEARANCE_CHANGED_EVENT.set()
+        if self._input_state() != state_before:
+            self.follow_cursor()
+            fill3.APPEARANCE_CHANGED_EVENT.set()
 
     def scroll(self, dx, dy):
         view_x, view_y = self.scroll_position
@@ -874,6 +1098,8 @@ class TextEditor:
             case terminal.MOUSE_PRESS:
                 self.on_mouse_press(x, y)
             case terminal.MOUSE_DRAG:
+                if (x, y) == self.last_mouse_position:
+                    return
                 self.on_mouse_drag(x, y)
         self.follow_cursor()
         fill3.APPEARANCE_CHANGED_EVENT.set()
@@ -881,30 +1107,35 @@ class TextEditor:
     def appearance(self):
         return self.decor_widget.appearance()
 
-    @functools.lru_cache(maxsize=100)
     def get_header(self, path, width, cursor_x, cursor_y, is_changed):
-        change_marker = "*" if is_changed else ""
-        cursor_position = termstr.TermStr(
-            f"Line {cursor_y+1} Column {cursor_x+1:<3}").fg_color(termstr.Color.grey_100)
-        path_colored = lscolors.path_colored(path) + change_marker
-        path_part = path_colored.ljust(width - len(cursor_position) - 2)
+        cursor_position = cursor_position_str(cursor_x, cursor_y)
+        path_part = colored_path(path, is_changed).ljust(width - len(cursor_position) - 2)
         header = " " + path_part + cursor_position + " "
         return termstr.TermStr(header).bg_color(termstr.Color.grey_30)
 
     def appearance_for(self, dimensions):
-        width, height = dimensions
-        if self.parts_widget is None:
-            parts_appearance = []
-        else:
-            self.parts_widget.dimensions = width, height // 5
-            parts_appearance = self.parts_widget.appearance()
-        self.parts_height = len(parts_appearance)
-        is_changed = self.text_widget.lines != self.original_text
-        header = self.get_header(self.path, width, self.cursor_x, self.cursor_y, is_changed)
-        self.last_width = width
-        self.last_height = height
-        body_appearance = self.view_widget.appearance_for((width, height-len(parts_appearance)-1))
-        return [header] + parts_appearance + body_appearance
+        key = (dimensions, id(self.text_widget), self.text_widget.version,
+               self._cursor_x, self._cursor_y, self.scroll_position, self.mark,
+               self.is_editing, self.is_overwriting, self.theme_index, self.saved_version,
+               None if self.parts_widget is None else
+               (self.parts_widget.cursor, self.parts_widget.is_focused))
+        if key != self._appearance_key:
+            width, height = dimensions
+            if self.parts_widget is None:
+                parts_appearance = []
+            else:
+                self.parts_widget.dimensions = width, height // 5
+                parts_appearance = self.parts_widget.appearance()
+            self.parts_height = len(parts_appearance)
+            is_changed = self.text_widget.version != self.saved_version
+            header = self.get_header(self.path, width, self.cursor_x, self.cursor_y, is_changed)
+            self.last_width = width
+            self.last_height = height
+            body_appearance = self.view_widget.appearance_for(
+                (width, height-len(parts_appearance)-1))
+            self._appearance = [header] + parts_appearance + body_appearance
+            self._appearance_key = key
+        return self._appearance.copy()
 
     KEY_MAP = {
         (terminal.CTRL_X, terminal.CTRL_S): save, terminal.BACKSPACE: backspace,
@@ -914,7 +1145,7 @@ class TextEditor:
         terminal.CTRL_A: jump_to_start_of_line, terminal.HOME: jump_to_start_of_line,
         terminal.CTRL_E: jump_to_end_of_line, terminal.END: jump_to_end_of_line,
         terminal.CTRL_O: open_line, terminal.ENTER: enter, terminal.CTRL_SPACE: set_mark,
-        terminal.CTRL_G: drop_highlight, terminal.PAGE_DOWN: page_down, terminal.CTRL_V: page_down,
+        terminal.PAGE_DOWN: page_down, terminal.CTRL_V: page_down,
         terminal.PAGE_UP: page_up, terminal.ALT_v: page_up, terminal.ALT_w: copy_selection,
         terminal.CTRL_W: delete_selection, terminal.CTRL_D: delete_character,
         terminal.DELETE: delete_character, terminal.ALT_d: delete_right,
@@ -932,12 +1163,16 @@ class TextEditor:
         terminal.CTRL_Z: undo, terminal.CTRL_G: abort_command, terminal.INSERT: toggle_overwrite,
         (terminal.CTRL_C, ">"): indent, (terminal.CTRL_C, "<"): dedent}
 
+    _PREFIX_KEYS = frozenset(key[0] for key in KEY_MAP if type(key) is tuple)
+    _SINGLE_KEY_ACTIONS, _MULTI_KEY_ACTIONS = _key_dispatch_tables(KEY_MAP)
+
 
 class FileBrowser:
 
     def __init__(self, paths):
         self.parts = [self._path_colored(path) for path in paths]
         self.cursor = 0
+        self._appearance_key = None
 
     @staticmethod
     def _path_colored(path):
@@ -951,10 +1186,12 @@ class FileBrowser:
 
     def appearance(self):
         width, height = self.dimensions
+        key = (self.cursor, self.dimensions)
+        if key == self._appearance_key:
+            return self._appearance
         parts = self.parts.copy()
         parts[self.cursor] = parts[self.cursor].invert()
-        result, coords = wrap_text(parts, width)
-        if len(result) > height:
+        if wrap_text_height(parts, width) > height:
             appearance, coords = wrap_text(parts, width - 1)
             line_num = coords[self.cursor][0] // (width - 1)
             appearance[line_num] = highlight_line(appearance[line_num])
@@ -965,28 +1202,59 @@ class FileBrowser:
                 view_widget.portal.limit_scroll(self.dimensions, (width, len(appearance)))
             result = view_widget.appearance_for(self.dimensions)
         else:
+            result, coords = wrap_text(parts, width)
             line_num = coords[self.cursor][0] // width
             result[line_num] = highlight_line(result[line_num])
+        self._appearance_key, self._appearance = key, result
         return result
 
 
 class TextFilesEditor:
 
+    MAX_CACHED_EDITORS = 64
+
     def __init__(self, paths):
         self.paths = paths
         self.file_browser = FileBrowser(paths)
         self.is_browsing = False
+        self._editors = {}
 
     @staticmethod
-    @functools.cache
-    def get_editor(path):
+    def _load_editor(path):
         editor = TextEditor()
         editor.load(path)
         return editor
 
+    def _cache_editor(self, path, editor):
+        editor = self._editors.setdefault(path, editor)
+        if len(self._editors) > TextFilesEditor.MAX_CACHED_EDITORS:
+            for cached_path, cached_editor in self._editors.items():
+                is_changed = cached_editor.text_widget.version != cached_editor.saved_version
+                if cached_path != path and not is_changed:
+                    del self._editors[cached_path]
+                    break
+        return editor
+
+    def get_editor(self, path):
+        try:
+            return self._editors[path]
+        except KeyError:
+            return self._cache_editor(path, self._load_editor(path))
+
     def current_editor(self):
         return self.get_editor(self.paths[self.file_browser.cursor])
 
+    async def _prefetch(self, path):
+        if path not in self._editors:  # Only load off-thread; mutate the cache on the loop.
+            self._cache_editor(path, await asyncio.to_thread(self._load_editor, path))
+
+    def prefetch_neighbours(self):
+        with contextlib.suppress(RuntimeError):
+            loop = asyncio.get_running_loop()
+            for offset in [-1, 1]:
+                path = self.paths[(self.file_browser.cursor + offset) % len(self.paths)]
+                loop.create_task(self._prefetch(path))
+
     def open_parts_browser(self):
         editor = self.current_editor()
         if editor.parts_widget is None:
@@ -1002,9 +1270,11 @@ class TextFilesEditor:
                 case terminal.LEFT:
                     self.file_browser.cursor_left()
                     self.open_parts_browser()
+                    self.prefetch_neighbours()
                 case terminal.RIGHT:
                     self.file_browser.cursor_right()
                     self.open_parts_browser()
+                    self.prefetch_neighbours()
                 case terminal.ESC:
                     self.is_browsing = False
                     self.current_editor().parts_widget.escape_parts_browser()
@@ -6,6 +6,29 @@ import unittest
 import diff_edit
 
 
+class MyersDiffTestCase(unittest.TestCase):
+
+    def test_myers_diff(self):
+        self.assertEqual(diff_edit.myers_diff([], []), [])
+        self.assertEqual(diff_edit.myers_diff(["a", "b"], ["a", "b"]),
+                         [("equal", 0, 2, 0, 2)])
+        self.assertEqual(diff_edit.myers_diff(["a", "b"], ["a", "c"]),
+                         [("equal", 0, 1, 0, 1), ("replace", 1, 2, 1, 2)])
+        self.assertEqual(diff_edit.myers_diff(["a", "b"], ["a"]),
+                         [("equal", 0, 1, 0, 1), ("delete", 1, 2, 1, 1)])
+        self.assertEqual(diff_edit.myers_diff(["a"], ["a", "b"]),
+                         [("equal", 0, 1, 0, 1), ("insert", 1, 1, 1, 2)])
+
+    def test_myers_diff_reconstructs_b(self):
+        a, b = list("abcabba"), list("cbabac")
+        result = []
+        for opcode, a_start, a_end, b_start, b_end in diff_edit.myers_diff(a, b):
+            if opcode == "equal":
+                self.assertEqual(a[a_start:a_end], b[b_start:b_end])
+            result.extend(b[b_start:b_end])
+        self.assertEqual(result, b)
+
+
 class OverlayListTestCase(unittest.TestCase):
 
     def test_overlay_list(self):
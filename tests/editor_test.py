@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 
+import copy
 import unittest
 
 import pygments.lexers.python
@@ -67,18 +68,26 @@ class WrapTextTestCase(unittest.TestCase):
         self.assertEqual(editor.wrap_text(["aa", "bb", "cc"], 5),
                          (["aa bb", "  cc "], [(0, 2), (3, 5), (7, 9)]))
 
+    def test_wrap_text_height(self):
+        self.assertEqual(editor.wrap_text_height(["aa", "bb", "cc"], 10), 1)
+        self.assertEqual(editor.wrap_text_height(["aa", "bb", "cc"], 5), 2)
+
 
 class PartsListTestCase(unittest.TestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        cls.python_lexer = pygments.lexers.python.PythonLexer()
+        cls.theme = pygments.styles.get_style_by_name("paraiso-dark")
+
     def test_parts_lines(self):
-        python_lexer = pygments.lexers.python.PythonLexer()
-        theme = pygments.styles.get_style_by_name("paraiso-dark")
-        class_charstyle = editor.char_style_for_token_type(pygments.token.Name.Class, theme)
-        self.assertEqual(editor.parts_lines("class A:\n    pass", python_lexer, theme),
+        class_charstyle = editor.char_style_for_token_type(pygments.token.Name.Class, self.theme)
+        self.assertEqual(editor.parts_lines("class A:\n    pass", self.python_lexer, self.theme),
                          [(termstr.TermStr("top"), 0), (termstr.TermStr("A", class_charstyle), 0),
                           (termstr.TermStr("bottom"), 1)])
-        func_charstyle = editor.char_style_for_token_type(pygments.token.Name.Function, theme)
-        self.assertEqual(editor.parts_lines("\ndef B:", python_lexer, theme),
+        func_charstyle = editor.char_style_for_token_type(pygments.token.Name.Function,
+                                                          self.theme)
+        self.assertEqual(editor.parts_lines("\ndef B:", self.python_lexer, self.theme),
                          [(termstr.TermStr("top"), 0), (termstr.TermStr("B", func_charstyle), 1),
                           (termstr.TermStr("bottom"), 1)])
 
@@ -95,8 +104,14 @@ class ExpandTabsTestCase(unittest.TestCase):
 
 class TextEditorTestCase(unittest.TestCase):
 
+    @classmethod
+    def setUpClass(cls):
+        cls.editor_prototype = editor.TextEditor()
+
     def setUp(self):
-        self.editor = editor.TextEditor()
+        # Key actions stay bound to the prototype, so tests call editor methods directly.
+        self.editor = copy.copy(self.editor_prototype)
+        self.editor.set_text("")
 
     def _assert_editor(self, expected_text, expected_cursor_position):
         cursor_x, cursor_y = expected_cursor_position
@@ -258,6 +273,15 @@ class TextEditorTestCase(unittest.TestCase):
         self._assert_change(self.editor.join_lines, "ab- -cd  ", (0, 0))
         self._assert_change(self.editor.join_lines, "ab- -cd  ", (0, 0))
 
+    def test_paste_from_clipboard(self):
+        self._set_editor("ab\ncd", (0, 0))
+        self._assert_change(self.editor.paste_from_clipboard, "ab\ncd", (0, 0))
+        self.editor.clipboard = ["xy"]
+        self._assert_change(self.editor.paste_from_clipboard, "xyab\ncd", (2, 0))
+        self._set_editor("ab\ncd", (1, 0))
+        self.editor.clipboard = ["1", "23", ""]
+        self._assert_change(self.editor.paste_from_clipboard, "a1\n23\nb\ncd", (0, 2))
+
     def test_delete_line(self):
         self._set_editor("a  \ndef", (1, 0))
         self._assert_change(self.editor.delete_line, "adef", (1, 0))
@@ -332,15 +356,15 @@ class TextEditorTestCase(unittest.TestCase):
         self.assertEqual(self.editor.mark, None)
 
     def test_expand_str_inverse(self):
-        self.assertEqual(editor.expand_str_inverse(""), [])
-        self.assertEqual(editor.expand_str_inverse("a"), [0])
-        self.assertEqual(editor.expand_str_inverse("a\tb"), [0, 1, 1, 1, 1, 1, 1, 1, 2])
-        self.assertEqual(editor.expand_str_inverse("aaaaaaaaaa\t"),
+        self.assertEqual(list(editor.expand_str_inverse("")), [])
+        self.assertEqual(list(editor.expand_str_inverse("a")), [0])
+        self.assertEqual(list(editor.expand_str_inverse("a\tb")), [0, 1, 1, 1, 1, 1, 1, 1, 2])
+        self.assertEqual(list(editor.expand_str_inverse("aaaaaaaaaa\t")),
                          [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 10, 10])
-        self.assertEqual(editor.expand_str_inverse("a\tb\tc"),
+        self.assertEqual(list(editor.expand_str_inverse("a\tb\tc")),
                          [0, 1, 1, 1, 1, 1, 1, 1, 2, 3, 3, 3, 3, 3, 3, 3, 4])
-        self.assertEqual(editor.expand_str_inverse("♓"), [0, 0])
-        self.assertEqual(editor.expand_str_inverse("♓\tb"), [0, 0, 1, 1, 1, 1, 1, 1, 2])
+        self.assertEqual(list(editor.expand_str_inverse("♓")), [0, 0])
+        self.assertEqual(list(editor.expand_str_inverse("♓\tb")), [0, 0, 1, 1, 1, 1, 1, 1, 2])
 
 
 if __name__ == "__main__":